@@ -1,129 +1,223 @@
+import math
 import re
+import sys
+from bisect import bisect_right
+from itertools import accumulate, islice
+from operator import itemgetter
 
-COMMANDS = ['CREATE', 'INSERT', 'PRINT_TREE', 'CONTAINS', 'SEARCH']
+_TOK_RE = re.compile(r'\w+|[\[\],]')
+_PAIR_RE = re.compile(r'\s*\[\s*(-?\d+)\s*,\s*(-?\d+)\s*\]')
+_INT_RE = re.compile(r'\s*(-?\d+)')
+_WORD_RE = re.compile(r'\s*\w+')
 
 class RTreeNode:
     """Вузол R-дерева"""
-    def __init__(self, is_leaf=True, segment=None):
+    __slots__ = ('is_leaf', 'children', 'bbox')
+
+    def __init__(self, is_leaf):
         self.is_leaf = is_leaf
-        self.segment = segment  
-        self.children = []  
-        self.bbox = segment  
-        self.left = None
-        self.right = None
+        self.children = None
+        self.bbox = None
 
     def update_bbox(self):
-        """Оновлення обмежувальної області на основі дочірніх елементів"""
-        if self.is_leaf:
-            self.bbox = [min(child[0] for child in self.children), max(child[1] for child in self.children)]
-        else:
-            self.bbox = [min(child.bbox[0] for child in self.children), max(child.bbox[1] for child in self.children)]
+        """Оновлення обмежувальної області внутрішнього вузла (bbox листа задається при побудові)"""
+        # діти впорядковані за лівим кінцем, тож мінімум дає лівий нащадок
+        left, right = self.children
+        self.bbox = [left.bbox[0], max(left.bbox[1], right.bbox[1])]
 
 
 class RTree:
     """R-дерево для зберігання множини відрізків"""
     def __init__(self):
         self.root = None
-        self.segments = []
+        self.segments = []  # незмінні кортежі (l, h)
+        self._seen = set()
+        self._min_lo = math.inf
+        self._max_hi = -math.inf
+        self._los = []
+        self._prefix_max_hi = []
+        self._idx_by_hi = []
+        self._his = []
+        self._snapshot = ()
+        self._dirty = False
 
     def insert(self, segment):
-        """Вставка відрізка в R-дерево"""
+        """Вставка відрізка в R-дерево; False, якщо він уже є (дерево перебудовується при першому запиті)"""
+        segment = tuple(segment)
+        if segment in self._seen:
+            return False
+        self._seen.add(segment)
         self.segments.append(segment)
-        self.root = self._build_tree_recursive(self.segments)
-
-    def _build_tree_recursive(self, segments):
-        """Рекурсивна побудова дерева"""
-        if len(segments) == 1:
-            node = RTreeNode(is_leaf=True, segment=segments[0])
-            node.children = segments
-            node.update_bbox()
+        l, h = segment
+        if l < self._min_lo:
+            self._min_lo = l
+        if h > self._max_hi:
+            self._max_hi = h
+        self._dirty = True
+        return True
+
+    def _ensure_built(self):
+        """Побудова дерева, якщо після останньої побудови були вставки"""
+        if not self._dirty:
+            return
+        # self.segments лишається відсортованим після попередньої побудови,
+        # тож сортування лише зливає з ним нові відрізки
+        self.segments.sort(key=itemgetter(0))
+        self.root = self._build_tree_recursive(self.segments, 0, len(self.segments))
+        # допоміжні масиви для бінарного пошуку в contains та LEFT_OF
+        self._los = [seg[0] for seg in self.segments]
+        self._prefix_max_hi = list(accumulate((seg[1] for seg in self.segments), max))
+        his = [seg[1] for seg in self.segments]
+        self._idx_by_hi = sorted(range(len(his)), key=his.__getitem__)
+        self._his = [his[i] for i in self._idx_by_hi]
+        self._snapshot = tuple(self.segments)
+        self._dirty = False
+
+    def _build_tree_recursive(self, segments, lo, hi):
+        """Рекурсивна побудова дерева над відсортованим діапазоном segments[lo:hi]"""
+        if hi - lo == 1:
+            node = RTreeNode(is_leaf=True)
+            node.children = [segments[lo]]
+            node.bbox = list(segments[lo])
             return node
 
-        segments.sort(key=lambda x: x[0])
-        mid = len(segments) // 2
-
-        left_segments = segments[:mid]
-        right_segments = segments[mid:]
+        mid = (lo + hi) // 2
 
         node = RTreeNode(is_leaf=False)
-        node.children = [self._build_tree_recursive(left_segments), self._build_tree_recursive(right_segments)]
+        node.children = [self._build_tree_recursive(segments, lo, mid),
+                         self._build_tree_recursive(segments, mid, hi)]
         node.update_bbox()
         return node
 
-    def print_tree(self, node=None, level=0, position="Root"):
+    def print_tree(self):
         """Вивід дерева з усіма сегментами"""
-        if node is None:
-            node = self.root
-
-        if node is None:
+        self._ensure_built()
+        if self.root is None:
             print("Tree is empty")
             return
 
-        indent = "  " * level
-        if node.is_leaf:
-            print(f"{indent}{position}: {node.bbox}")
-        else:
-            print(f"{indent}{position}:  {node.bbox}")
-            self.print_tree(node.children[0], level + 1, "Left Child")
-            self.print_tree(node.children[1], level + 1, "Right Child")
+        out = []
+        stack = [(self.root, "", "Root")]
+        while stack:
+            node, indent, position = stack.pop()
+            if node.is_leaf:
+                out.append(f"{indent}{position}: {node.bbox}")
+            else:
+                out.append(f"{indent}{position}:  {node.bbox}")
+                child_indent = indent + "  "
+                stack.append((node.children[1], child_indent, "Right Child"))
+                stack.append((node.children[0], child_indent, "Left Child"))
+        sys.stdout.write('\n'.join(out) + '\n')
 
     def contains(self, segment):
         """Перевірка входження сегмента [l, h]"""
         L, H = segment
-        for l, h in self.segments:
-            if l <= L and H <= h:
-                return True
-        return False
+        if L < self._min_lo or H > self._max_hi:
+            return False
+        if (L, H) in self._seen:
+            return True
+        self._ensure_built()
+        # серед відрізків з l <= L шукаємо найбільший h
+        i = bisect_right(self._los, L)
+        return i > 0 and self._prefix_max_hi[i - 1] >= H
 
     def search(self, query_type=None, params=None):
-        """Пошук відрізків за умовою"""
-        results = []
+        """Пошук відрізків за умовою; повертає кортеж відрізків (l, h), впорядкований за l"""
+        self._ensure_built()
         if query_type is None:  # No filter
-            return self.segments
-        elif query_type == 'CONTAINS':
+            return self._snapshot
+        results = []
+        if self.root is None:
+            return ()
+        if query_type == 'CONTAINS':
             L, H = params
-            results = [seg for seg in self.segments if seg[0] <= L and H <= seg[1]]
+            self._search_contains(self.root, L, H, results)
         elif query_type == 'INTERSECTS':
             L, H = params
-            results = [seg for seg in self.segments if not (seg[1] < L or H < seg[0])]
+            self._search_intersects(self.root, L, H, results)
         elif query_type == 'LEFT_OF':
-            x = params
-            results = [seg for seg in self.segments if seg[1] <= x]
-        return results
+            # індекси знайдених відрізків у self.segments повертають порядок за l
+            hits = sorted(self._idx_by_hi[:bisect_right(self._his, params)])
+            results = [self.segments[i] for i in hits]
+        return tuple(results)
+
+    # bbox листа збігається з його відрізком, тож перевірка bbox
+    # у листі вже є перевіркою самого відрізка.
+    # Дітей кладемо на стек справа наліво, щоб результати йшли за зростанням l
+    def _search_contains(self, root, L, H, out):
+        """Відрізки, що містять [L, H]"""
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node.bbox[0] > L or node.bbox[1] < H:
+                continue
+            if node.is_leaf:
+                out.extend(node.children)
+            else:
+                stack.append(node.children[1])
+                stack.append(node.children[0])
+
+    def _search_intersects(self, root, L, H, out):
+        """Відрізки, що перетинаються з [L, H]"""
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node.bbox[1] < L or node.bbox[0] > H:
+                continue
+            if node.is_leaf:
+                out.extend(node.children)
+            else:
+                stack.append(node.children[1])
+                stack.append(node.children[0])
+
+
+def _match_args(pattern, command, skip):
+    """Зіставлення pattern з початком решти command після перших skip слів (хвіст ігнорується)"""
+    pos = 0
+    for _ in range(skip):
+        word = _WORD_RE.match(command, pos)
+        if word is None:
+            return None
+        pos = word.end()
+    return pattern.match(command, pos)
+
+
+def _format_segments(segments):
+    """Відрізки у форматі [[l, h], ...]"""
+    return '[' + ', '.join(f'[{l}, {h}]' for l, h in segments) + ']'
 
 
 class Lexer:
-    def tokenize(self, command):
-        tokens = re.findall(r'\w+|\[|\]|\d+|,', command)
-        return tokens
+    def itokenize(self, command):
+        return (m.group() for m in _TOK_RE.finditer(command))
 
 
 class Parser:
     def __init__(self):
         self.lexer = Lexer()
         self.trees = {}
+        self._dispatch = {
+            'CREATE': self.create,
+            'INSERT': self.insert,
+            'PRINT_TREE': self.print_tree,
+            'CONTAINS': self.contains,
+            'SEARCH': self.search,
+        }
 
     def parse(self, command):
-        tokens = self.lexer.tokenize(command)
-        if not tokens:
+        it = self.lexer.itokenize(command)
+        first = next(it, None)
+        if first is None:
             return 'Invalid command'
 
-        command_type = tokens[0].upper()
-        if command_type in COMMANDS:
-            if command_type == 'CREATE':
-                return self.create(tokens)
-            elif command_type == 'INSERT':
-                return self.insert(tokens)
-            elif command_type == 'PRINT_TREE':
-                return self.print_tree(tokens)
-            elif command_type == 'CONTAINS':
-                return self.contains(tokens)
-            elif command_type == 'SEARCH':
-                return self.search(tokens)
-        else:
+        handler = self._dispatch.get(first.upper())
+        if handler is None:
             return 'Unknown command'
+        # обробникам потрібні щонайбільше перші п'ять токенів
+        tokens = (first, *islice(it, 4))
+        return handler(tokens, command)
 
-    def create(self, tokens):
+    def create(self, tokens, command):
         if len(tokens) < 2:
             return 'Invalid CREATE command: missing set name'
 
@@ -133,7 +227,7 @@ class Parser:
         self.trees[set_name] = RTree()
         return f'Set {set_name} has been created'
 
-    def insert(self, tokens):
+    def insert(self, tokens, command):
         if len(tokens) < 4:
             return 'Invalid INSERT command: missing parameters'
 
@@ -141,18 +235,20 @@ class Parser:
         if set_name not in self.trees:
             return f'Set {set_name} does not exist'
 
-        try:
-            l = int(tokens[3])
-            h = int(tokens[5])
-            if l > h:
-                return 'Invalid INSERT command: lower bound greater than upper bound'
-
-            self.trees[set_name].insert([l, h])
-            return f'Range [{l}, {h}] has been added to {set_name}'
-        except (ValueError, IndexError):
+        pair = _match_args(_PAIR_RE, command, 2)
+        if pair is None:
             return 'Invalid INSERT command: invalid segment format'
 
-    def print_tree(self, tokens):
+        l = int(pair.group(1))
+        h = int(pair.group(2))
+        if l > h:
+            return 'Invalid INSERT command: lower bound greater than upper bound'
+
+        if not self.trees[set_name].insert((l, h)):
+            return f'Range [{l}, {h}] is already in {set_name}'
+        return f'Range [{l}, {h}] has been added to {set_name}'
+
+    def print_tree(self, tokens, command):
         if len(tokens) < 2:
             return 'Invalid PRINT_TREE command: missing set name'
 
@@ -163,7 +259,7 @@ class Parser:
         self.trees[set_name].print_tree()
         return f'Tree for {set_name} printed above'
 
-    def contains(self, tokens):
+    def contains(self, tokens, command):
         if len(tokens) < 4:
             return 'Invalid CONTAINS command: missing parameters'
 
@@ -171,15 +267,14 @@ class Parser:
         if set_name not in self.trees:
             return f'Set {set_name} does not exist'
 
-        try:
-            l = int(tokens[3])
-            h = int(tokens[5])
-            result = self.trees[set_name].contains([l, h])
-            return str(result)
-        except (ValueError, IndexError):
+        pair = _match_args(_PAIR_RE, command, 2)
+        if pair is None:
             return 'Invalid CONTAINS command: invalid segment format'
 
-    def search(self, tokens):
+        result = self.trees[set_name].contains((int(pair.group(1)), int(pair.group(2))))
+        return str(result)
+
+    def search(self, tokens, command):
         if len(tokens) < 2:
             return 'Invalid SEARCH command: missing set name'
 
@@ -189,25 +284,25 @@ class Parser:
 
         if len(tokens) == 2:
             results = self.trees[set_name].search()
-            return f'Search results: {results}'
+            return f'Search results: {_format_segments(results)}'
 
         if len(tokens) < 4 or tokens[2].upper() != 'WHERE':
             return 'Invalid SEARCH command: invalid WHERE clause'
 
         query_type = tokens[3].upper()
-        try:
-            if query_type in ['CONTAINS', 'INTERSECTS']:
-                l = int(tokens[5])
-                h = int(tokens[7])
-                results = self.trees[set_name].search(query_type, [l, h])
-            elif query_type == 'LEFT_OF':
-                x = int(tokens[4])
-                results = self.trees[set_name].search(query_type, x)
-            else:
-                return 'Invalid SEARCH command: unknown search type'
-            return f'Search results: {results}'
-        except (ValueError, IndexError):
-            return f'Invalid SEARCH command: invalid {query_type} parameters'
+        if query_type in ['CONTAINS', 'INTERSECTS']:
+            pair = _match_args(_PAIR_RE, command, 4)
+            if pair is None:
+                return f'Invalid SEARCH command: invalid {query_type} parameters'
+            results = self.trees[set_name].search(query_type, (int(pair.group(1)), int(pair.group(2))))
+        elif query_type == 'LEFT_OF':
+            num = _match_args(_INT_RE, command, 4)
+            if num is None:
+                return f'Invalid SEARCH command: invalid {query_type} parameters'
+            results = self.trees[set_name].search(query_type, int(num.group(1)))
+        else:
+            return 'Invalid SEARCH command: unknown search type'
+        return f'Search results: {_format_segments(results)}'
 
 
 def main():